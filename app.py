@@ -1,6 +1,9 @@
 import streamlit as st
 import pandas as pd
-from mitosheet.streamlit.v1 import spreadsheet
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
 from streamlit_option_menu import option_menu
 from src import data_handler, config, schema_manager
 
@@ -43,8 +46,78 @@ DUMMY_DATA = {
     })
 }
 
+# 新規マスター登録フォームのカラム定義の初期値 (直接編集せず、copy() して使用する)
+DEFAULT_NEW_SCHEMA_DF = pd.DataFrame([
+    {"name": "id", "type": "STRING", "security_level": "C", "constraints": ["NOT NULL", "UNIQUE"]},
+    {"name": "created_at", "type": "TIMESTAMP", "security_level": "C", "constraints": ["NOT NULL"]}
+])
+
 # -------------------------
 
+@st.cache_resource
+def get_spreadsheet():
+    """Mitoのspreadsheetコンポーネントを取得する (読み込みが重いため、編集画面で初めて必要になった時にimportする)"""
+    from mitosheet.streamlit.v1 import spreadsheet
+    return spreadsheet
+
+@st.cache_resource
+def get_executor():
+    """BigQuery読み込みを並行実行するためのスレッドプール (プロセス内で共有)"""
+    return ThreadPoolExecutor(max_workers=4)
+
+def submit_with_ctx(fn, *args):
+    """現在のスクリプト実行コンテキストを引き継いでスレッドプールで fn を実行する
+
+    st.cache_data の関数をプールのスレッドから呼び出すと、コンテキストがないため警告が出るため。
+    """
+    ctx = get_script_run_ctx()
+    def run():
+        thread = threading.current_thread()
+        previous_ctx = get_script_run_ctx(suppress_warning=True)
+        add_script_run_ctx(thread, ctx)
+        try:
+            return fn(*args)
+        finally:
+            # プールのスレッドは再利用されるため、終了したセッション (session_state) を参照し続けないよう元に戻す
+            # (add_script_run_ctx は None を指定しても外せないため、属性を直接削除する)
+            if previous_ctx is None:
+                if hasattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME):
+                    delattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME)
+            else:
+                add_script_run_ctx(thread, previous_ctx)
+    return get_executor().submit(run)
+
+def frame_hash(df):
+    """DataFrameの内容 (インデックス含む) のハッシュ値を返す (ハッシュ化できない値を含む場合は None)"""
+    try:
+        return pd.util.hash_pandas_object(df, index=True).values.tobytes()
+    except TypeError:
+        return None
+
+def is_modified(initial_df, initial_hash, edited_df):
+    """Mitoで編集されたDataFrameが読み込み時のDataFrameから変更されているか判定する"""
+    if edited_df is initial_df:
+        return False
+    if initial_df.shape != edited_df.shape or not initial_df.columns.equals(edited_df.columns):
+        return True
+    edited_hash = frame_hash(edited_df) if initial_hash is not None else None
+    if edited_hash is None:
+        return not initial_df.equals(edited_df)
+    return edited_hash != initial_hash
+
+def clear_initial_data(master):
+    """session_state に保持している読み込み時のデータとハッシュを破棄する"""
+    st.session_state.pop(f"initial_df_{master}", None)
+    st.session_state.pop(f"initial_hash_{master}", None)
+
+@st.cache_data(ttl=600, show_spinner=False) # プールのスレッドから呼び出すためスピナーは表示しない
+def get_schema_df(master):
+    """スキーマ定義のカラム一覧を表示用DataFrameとして取得する (定義の登録・削除時に clear する)"""
+    schema_info = data_handler.get_master_schema(master)
+    if not schema_info:
+        return None
+    return pd.DataFrame(schema_info.get("columns", []))
+
 st.set_page_config(layout="wide")
 st.title("（仮称）マスターデータ管理・検査アプリケーション")
 
@@ -72,10 +145,7 @@ if selected_menu == "新規マスター登録":
         st.caption("カラム定義:")
         # スキーマ定義用データエディタ (session_state で管理)
         if 'new_schema_df' not in st.session_state:
-            st.session_state.new_schema_df = pd.DataFrame([
-                {"name": "id", "type": "STRING", "security_level": "C", "constraints": ["NOT NULL", "UNIQUE"]},
-                {"name": "created_at", "type": "TIMESTAMP", "security_level": "C", "constraints": ["NOT NULL"]}
-            ])
+            st.session_state.new_schema_df = DEFAULT_NEW_SCHEMA_DF.copy()
 
         edited_schema_df = st.data_editor(
             st.session_state.new_schema_df,
@@ -105,31 +175,33 @@ if selected_menu == "新規マスター登録":
         submitted = st.form_submit_button("登録実行")
         if submitted:
             if new_master_name and not edited_schema_df.empty:
-                # バリデーション
-                if edited_schema_df['name'].duplicated().any():
-                    st.error("エラー: カラム名が重複しています。")
-                elif edited_schema_df['name'].isnull().any() or (edited_schema_df['name'] == "").any():
-                    st.error("エラー: カラム名が空の行があります。")
-                elif edited_schema_df['type'].isnull().any():
-                    st.error("エラー: データ型が選択されていない行があります。")
-                elif edited_schema_df['security_level'].isnull().any():
-                    st.error("エラー: セキュリティレベルが選択されていない行があります。")
+                # バリデーション (各条件のマスクをまとめて計算し、該当する行番号を表示する)
+                names = edited_schema_df['name']
+                empty_name = (names.isna() | names.eq("")).to_numpy()
+                validation_checks = [
+                    ("カラム名が重複しています。", names.duplicated(keep=False).to_numpy() & ~empty_name),
+                    ("カラム名が空の行があります。", empty_name),
+                    ("データ型が選択されていない行があります。", edited_schema_df['type'].isna().to_numpy()),
+                    ("セキュリティレベルが選択されていない行があります。", edited_schema_df['security_level'].isna().to_numpy()),
+                ]
+                failed_checks = [(message, mask) for message, mask in validation_checks if mask.any()]
+                if failed_checks:
+                    for message, mask in failed_checks:
+                        rows = ", ".join(str(i + 1) for i in mask.nonzero()[0])
+                        st.error(f"エラー: {message} (行: {rows})")
                 else:
                     try:
                         # DataFrameをリスト形式に変換 (constraints も含める)
-                        columns_to_save = edited_schema_df.to_dict('records')
-                        # constraints が None や NaN の場合に空リストに変換
-                        for col in columns_to_save:
-                            if not isinstance(col.get('constraints'), list):
-                                col['constraints'] = []
+                        # constraints が None や NaN の場合は空リストに変換しておく
+                        columns_to_save = edited_schema_df.assign(
+                            constraints=edited_schema_df['constraints'].apply(lambda x: x if isinstance(x, list) else [])
+                        ).to_dict('records')
 
                         data_handler.create_new_master(new_master_name, columns_to_save)
                         st.success(f"マスター「{new_master_name}」を登録しました。")
+                        get_schema_df.clear()
                         # 成功したらフォームをリセットするための状態をクリア
-                        st.session_state.new_schema_df = pd.DataFrame([
-                            {"name": "id", "type": "STRING", "security_level": "C", "constraints": ["NOT NULL", "UNIQUE"]},
-                            {"name": "created_at", "type": "TIMESTAMP", "security_level": "C", "constraints": ["NOT NULL"]}
-                         ])
+                        st.session_state.new_schema_df = DEFAULT_NEW_SCHEMA_DF.copy()
                         # new_master_name は clear_on_submit=True でクリアされるはず
                     except ValueError as ve:
                         st.error(f"登録エラー: {ve}")
@@ -161,12 +233,27 @@ elif selected_menu == "既存マスター編集":
     )
 
     if selected_master:
+        # 既存データ読み込み
+        # 保存・削除時に load_data.clear() でキャッシュを破棄する
+        @st.cache_data(ttl=300, show_spinner=False, max_entries=16)
+        def load_data(master):
+             # 変更検知用のハッシュもデータと一緒にキャッシュする
+             df = data_handler.load_master_data(master)
+             return df, frame_hash(df) if isinstance(df, pd.DataFrame) else None
+
+        # スキーマ取得とデータ読み込みは独立しているため並行して開始する
+        schema_future = submit_with_ctx(get_schema_df, selected_master)
+        # 読み込み済みのデータは session_state から再利用する (保存・削除時に破棄)
+        if f"initial_df_{selected_master}" in st.session_state:
+            data_future = None
+        else:
+            data_future = submit_with_ctx(load_data, selected_master)
+
         # --- スキーマ表示 (Expander内) ---
         with st.expander("選択中マスターのスキーマ定義", expanded=False):
             try:
-                schema_info = data_handler.get_master_schema(selected_master)
-                if schema_info:
-                    schema_df = pd.DataFrame(schema_info.get("columns", []))
+                schema_df = schema_future.result()
+                if schema_df is not None:
                     st.dataframe(schema_df, use_container_width=True, hide_index=True)
                     # TODO: スキーマ編集機能への導線
                     if st.button("スキーマを編集する (未実装)", key="edit_schema_button"):
@@ -179,20 +266,21 @@ elif selected_menu == "既存マスター編集":
         # --- データ編集 (Mito) ---
         st.subheader(f"「{selected_master}」のデータ編集")
 
-        # 既存データ読み込み
-        # @st.cache_data # キャッシュを一旦無効化して常に最新を読み込む
-        def load_data(master):
-             return data_handler.load_master_data(master)
-
         initial_df = None
         load_error = None
 
         with st.spinner(f"データをBigQueryから読み込み中..."):
             try:
-                initial_df = load_data(selected_master)
-                if not isinstance(initial_df, pd.DataFrame):
-                    initial_df = None
-                    raise TypeError("データ読み込み結果が DataFrameではありませんでした。")
+                if data_future is None:
+                    initial_df = st.session_state[f"initial_df_{selected_master}"]
+                    initial_hash = st.session_state[f"initial_hash_{selected_master}"]
+                else:
+                    initial_df, initial_hash = data_future.result()
+                    if not isinstance(initial_df, pd.DataFrame):
+                        initial_df = None
+                        raise TypeError("データ読み込み結果が DataFrameではありませんでした。")
+                    st.session_state[f"initial_df_{selected_master}"] = initial_df
+                    st.session_state[f"initial_hash_{selected_master}"] = initial_hash
             except Exception as e:
                 load_error = e
                 initial_df = None
@@ -205,17 +293,19 @@ elif selected_menu == "既存マスター編集":
             if initial_df.empty:
                 st.info("現在データはありません。Mitoシート上で新規データを入力できます。")
 
-            # デバッグ: Mitoに渡すデータを確認
-            st.caption("Mitoに渡されるデータ (プレビュー):")
-            st.dataframe(initial_df)
+            # デバッグ: Mitoに渡すデータを確認 (Mitoと同じデータを二重に送信しないよう既定では非表示)
+            if st.toggle("Mitoに渡されるデータを表示 (デバッグ用)", value=False, key=f"raw_preview_{selected_master}"):
+                st.caption("Mitoに渡されるデータ (プレビュー):")
+                st.dataframe(initial_df)
 
             # Mitoスプレッドシート表示
             st.info("Mitoを使用してデータを編集してください。編集後、「保存」ボタンを押してください。")
+            spreadsheet = get_spreadsheet()
             final_dfs, code = spreadsheet(initial_df, key=f"mito_sheet_{selected_master}")
 
             if final_dfs and isinstance(final_dfs, list):
                 edited_df = final_dfs[0]
-                if initial_df.shape != edited_df.shape or not initial_df.equals(edited_df):
+                if is_modified(initial_df, initial_hash, edited_df):
                     st.subheader("編集後のデータ (プレビュー)")
                     st.dataframe(edited_df)
 
@@ -223,9 +313,19 @@ elif selected_menu == "既存マスター編集":
                         with st.spinner("保存処理を実行中..."):
                             try:
                                 success, result = data_handler.save_master_data(selected_master, edited_df)
+                            except Exception as e:
+                                # 書き込みの状況が不明なため、キャッシュを破棄して次回は読み直す
+                                load_data.clear()
+                                clear_initial_data(selected_master)
+                                st.error(f"保存処理中に予期せぬエラーが発生しました: {e}")
+                            else:
+                                # 保存を試みた場合 (成功・保存エラー) はBigQuery上のデータが変わり得るため、
+                                # 結果の表示より先にキャッシュを破棄する (検査違反の場合は保存していないため編集内容を残す)
+                                if success or (result and result.get("type") == "save_error"):
+                                    load_data.clear()
+                                    clear_initial_data(selected_master)
                                 if success:
                                     st.success(f"マスター「{selected_master}」をBigQueryに正常に保存しました。")
-                                    # load_data.clear() # キャッシュ削除に伴い不要
                                     st.rerun()
                                 else:
                                     # エラー処理 (変更なし)
@@ -237,8 +337,6 @@ elif selected_menu == "既存マスター編集":
                                         st.error(f"BigQueryへの保存中にエラーが発生しました: {result.get('message')}")
                                     else:
                                         st.error("不明なエラーにより保存に失敗しました。")
-                            except Exception as e:
-                                st.error(f"保存処理中に予期せぬエラーが発生しました: {e}")
                 else:
                     st.caption("データに変更はありません。")
         # else: initial_df is None かつ load_error is None の場合 (通常は発生しない)
@@ -254,7 +352,9 @@ elif selected_menu == "既存マスター編集":
                         data_handler.delete_master_definition(selected_master)
                         st.success(f"マスター「{selected_master}」の定義を削除しました。")
                         # キャッシュクリアとリロード
-                        # load_data.clear() # 関連キャッシュもクリア
+                        load_data.clear() # 関連キャッシュもクリア
+                        clear_initial_data(selected_master)
+                        get_schema_df.clear()
                         st.rerun()
                     except Exception as e:
                         st.error(f"マスター定義削除エラー: {e}")
@@ -1,28 +1,67 @@
 from google.cloud import bigquery
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
 from . import config, schema_manager
+import io
 import json
-from typing import Dict
+import functools
+import re
+from typing import Dict, List, Tuple
 import logging
 import random
 import string
-from datetime import datetime
+from datetime import datetime, date, timezone
 from google.cloud.exceptions import NotFound, Conflict
 from google.api_core.exceptions import GoogleAPICallError, BadRequest
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+
+try:
+    # orjson が利用可能であれば高速なJSONパーサーを使用する
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    # BigQuery Storage API (未インストールの場合は通常のREST経由/ロードジョブで読み書きする)
+    from google.cloud import bigquery_storage
+    from google.cloud.bigquery_storage_v1 import types as bqs_types, writer as bqs_writer
+except ImportError:
+    bigquery_storage = None
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
-# BigQueryクライアントの初期化 (ADCを使用)
-# 環境変数 GOOGLE_APPLICATION_CREDENTIALS が設定されているか、
-# gcloud auth application-default login が実行されていれば自動で認証されます。
-client = bigquery.Client(project=config.GOOGLE_CLOUD_PROJECT)
-dataset_ref = client.dataset(config.BIGQUERY_DATASET_ID)
-
 schema_table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{config.BIGQUERY_SCHEMA_TABLE_ID}"
 
+@st.cache_resource
+def get_bq_client() -> bigquery.Client:
+    """BigQueryクライアントを取得する (プロセス内で1つを共有)"""
+    # ADCを使用して初期化する
+    # 環境変数 GOOGLE_APPLICATION_CREDENTIALS が設定されているか、
+    # gcloud auth application-default login が実行されていれば自動で認証されます。
+    return bigquery.Client(project=config.GOOGLE_CLOUD_PROJECT)
+
+@st.cache_resource
+def get_bqstorage_client():
+    """BigQuery Storage APIの読み込みクライアントを取得する (利用できない場合は None)"""
+    if bigquery_storage is None:
+        logger.warning("google-cloud-bigquery-storage が見つからないため、Storage APIを使用せずに読み込みます。")
+        return None
+    return bigquery_storage.BigQueryReadClient()
+
+@st.cache_resource
+def get_bqwrite_client():
+    """BigQuery Storage APIの書き込みクライアントを取得する (利用できない場合は None)"""
+    if bigquery_storage is None:
+        return None
+    return bigquery_storage.BigQueryWriteClient()
+
 def load_data_from_bq(master_name: str) -> pd.DataFrame:
     """指定されたマスターのデータをBigQueryから読み込む"""
+    client = get_bq_client()
     table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{master_name}"
     logger.info(f"[BQ Client] BigQueryからデータを読み込み開始: {table_id}")
 
@@ -48,23 +87,31 @@ def load_data_from_bq(master_name: str) -> pd.DataFrame:
 
     # テーブルが存在する場合のデータ読み込み
     try:
-        query = f"SELECT * FROM `{table_id}`"
-        logger.debug(f"[BQ Client] クエリ実行: {query}")
-        # .to_dataframe() は内部でイテレータを処理する
-        df = client.query(query).to_dataframe()
-        logger.info(f"[BQ Client] クエリ完了、DataFrame変換後: Shape={df.shape}")
+        # テーブル全体の読み込みはクエリジョブを発行せず、取得済みの table から直接読む
+        # 保存時は WRITE_TRUNCATE でテーブルを置き換えるため、スキーマ定義にないカラムも含めて全カラムを読み込む
+        # (読み込み時に除外すると、次回の保存でそのカラムとデータが削除されてしまう)
+        logger.debug(f"[BQ Client] テーブルデータ読み込み: {table_id}")
+        # Storage API (Arrow形式) でダウンロードし、REST/JSON経由の変換を避ける
+        df = client.list_rows(table).to_dataframe(
+            bqstorage_client=get_bqstorage_client(),
+            create_bqstorage_client=False,
+        )
+        logger.info(f"[BQ Client] 読み込み完了、DataFrame変換後: Shape={df.shape}")
         if not df.empty:
             logger.debug(f"[BQ Client] DataFrameの内容 (先頭5件):\n{df.head().to_string()}")
         else:
             logger.info("[BQ Client] DataFrameは空です。")
         return df
     except Exception as e:
-        logger.error(f"[BQ Client] クエリ実行またはDataFrame変換中にエラーが発生しました: {e}")
-        logger.warning("[BQ Client] エラーのため、空のDataFrameを返します。")
-        return pd.DataFrame()
+        logger.error(f"[BQ Client] データ読み込みまたはDataFrame変換中にエラーが発生しました: {e}")
+        # 空のDataFrameを返すと、呼び出し元でキャッシュされたうえで保存時に既存データを上書きしてしまうため再raiseする
+        raise
 
 def save_data_to_bq(master_name: str, df: pd.DataFrame):
-    """指定されたマスターのデータをBigQueryに上書き保存する (WRITE_TRUNCATE)"""
+    """指定されたマスターのデータをBigQueryに上書き保存する (WRITE_TRUNCATE)
+
+    上書きはロードジョブ1回で行い、テーブルの置き換えをアトミックにする。
+    """
     table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{master_name}"
     logger.info(f"BigQueryへデータを保存中: {table_id} ({len(df)} 件)")
 
@@ -73,26 +120,69 @@ def save_data_to_bq(master_name: str, df: pd.DataFrame):
     if not schema_def:
         raise ValueError(f"マスター '{master_name}' のスキーマ定義が見つかりません。")
 
-    # BigQueryのスキーマを定義 (schema_managerの定義から変換)
-    bq_schema = []
-    column_map = {col['name']: col['type'] for col in schema_def.get("columns", [])}
-    for col_name in df.columns:
-        bq_type = column_map.get(col_name, "STRING") # 不明な場合はSTRINGとする
-        # TODO: より厳密な型マッピング (例: INTEGER, FLOAT, DATE, TIMESTAMP)
-        bq_schema.append(bigquery.SchemaField(col_name, bq_type))
+    # DataFrame から Arrow への変換はここで一度だけ行う
+    bq_schema = _bq_schema_for_columns(schema_def, df.columns)
+    save_arrow_to_bq(master_name, to_arrow_table(df, bq_schema), bq_schema)
+
+def _bq_schema_for_columns(schema_def: Dict, columns) -> List[bigquery.SchemaField]:
+    """スキーマ定義から、指定されたカラム順の BigQuery スキーマを組み立てる
+
+    型・モードの変換は create_data_table と同じ規則で行う (定義にないカラムはSTRING/NULLABLE)。
+    """
+    column_defs = {col['name']: col for col in schema_def.get("columns", [])}
+    return [
+        bigquery.SchemaField(
+            col_name,
+            _bq_type_mapper(col_def.get("type", "STRING")),
+            mode=_bq_mode_mapper(col_def.get("constraints")),
+        )
+        for col_name, col_def in ((name, column_defs.get(name, {})) for name in columns)
+    ]
+
+def to_arrow_table(df: pd.DataFrame, bq_schema: List[bigquery.SchemaField]) -> pa.Table:
+    """DataFrameを BigQuery スキーマに合わせた Arrow テーブルに変換する
+
+    load_table_from_dataframe 内部での型推論を避けるため、Arrow スキーマを明示して変換する。
+    JSON型のカラムの dict/list の値は、Storage Write API での追加 (_to_proto_value) と同様にJSON文字列に変換する。
+    """
+    json_columns = {
+        field.name: df[field.name].map(lambda v: v if isinstance(v, str) or _is_null(v) else json.dumps(v, ensure_ascii=False))
+        for field in bq_schema
+        if _bq_type_mapper(field.field_type) == "JSON" and field.name in df.columns
+    }
+    if json_columns:
+        df = df.assign(**json_columns)
+    pa_schema = pa.schema([pa.field(field.name, _pa_type_mapper(field.field_type)) for field in bq_schema])
+    return pa.Table.from_pandas(df, schema=pa_schema, preserve_index=False)
 
-    # DataFrameのデータ型をBigQueryの型に合わせる (必要に応じて)
-    # 例: df['price'] = df['price'].astype(float)
+def save_arrow_to_bq(master_name: str, arrow_table: pa.Table, bq_schema: List[bigquery.SchemaField] | None = None):
+    """Arrow テーブルを Parquet に変換し、ロードジョブで BigQuery に上書き保存する (WRITE_TRUNCATE)
+
+    bq_schema を省略した場合はマスターのスキーマ定義から組み立てる。
+    """
+    client = get_bq_client()
+    table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{master_name}"
+    if bq_schema is None:
+        schema_def = schema_manager.get_schema(master_name)
+        if not schema_def:
+            raise ValueError(f"マスター '{master_name}' のスキーマ定義が見つかりません。")
+        bq_schema = _bq_schema_for_columns(schema_def, arrow_table.column_names)
+
+    parquet_buffer = io.BytesIO()
+    pq.write_table(arrow_table, parquet_buffer)
+    parquet_buffer.seek(0)
 
     job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.PARQUET,
         schema=bq_schema,
         write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE, # テーブルを上書き
         # 必要に応じてパーティションやクラスタリングの設定を追加
     )
 
+    load_job = None
     try:
-        load_job = client.load_table_from_dataframe(
-            df, table_id, job_config=job_config
+        load_job = client.load_table_from_file(
+            parquet_buffer, table_id, job_config=job_config
         )
         logger.info(f"  Load job {load_job.job_id} を開始しました。")
 
@@ -110,10 +200,133 @@ def save_data_to_bq(master_name: str, df: pd.DataFrame):
                 logger.error(f"    Reason: {error['reason']}, Message: {error['message']}")
         raise
 
+# --- Storage Write API による行の追加 ---
+# 上書き保存はアトミックなロードジョブ (WRITE_TRUNCATE) で行い、Storage Write API は行の追加にのみ使用する
+# 1回の AppendRows リクエストで送信する行数 (リクエストサイズ上限 10MB に収まるように)
+STORAGE_WRITE_BATCH_ROWS = 500
+
+# BigQueryの型 (_bq_type_mapper 変換後) と protobuf の型の対応
+_PROTO_TYPE_MAP = {
+    "STRING": descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+    "INT64": descriptor_pb2.FieldDescriptorProto.TYPE_INT64,
+    "FLOAT64": descriptor_pb2.FieldDescriptorProto.TYPE_DOUBLE,
+    "BOOL": descriptor_pb2.FieldDescriptorProto.TYPE_BOOL,
+    "DATE": descriptor_pb2.FieldDescriptorProto.TYPE_INT32, # 1970-01-01 からの日数
+    "TIMESTAMP": descriptor_pb2.FieldDescriptorProto.TYPE_INT64, # UNIXエポックからのマイクロ秒
+    "JSON": descriptor_pb2.FieldDescriptorProto.TYPE_STRING,
+}
+_PROTO_FIELD_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_EPOCH_DATE = date(1970, 1, 1)
+
+def _build_row_message_class(schema: List[bigquery.SchemaField]) -> Tuple[type, descriptor_pb2.DescriptorProto]:
+    """テーブルスキーマから行データ用の protobuf メッセージクラスと記述子を動的に生成する"""
+    file_proto = descriptor_pb2.FileDescriptorProto(name="master_row.proto", package="mock_mito", syntax="proto2")
+    message_proto = file_proto.message_type.add(name="MasterRow")
+    for number, field in enumerate(schema, start=1):
+        # protobuf のフィールド名として使えないカラム名や、ネスト/配列型には対応しない
+        if not _PROTO_FIELD_NAME.fullmatch(field.name):
+            raise ValueError(f"カラム名 '{field.name}' は Storage Write API で扱えません。")
+        if field.mode == "REPEATED" or field.field_type in ("RECORD", "STRUCT"):
+            raise ValueError(f"カラム '{field.name}' の型 ({field.mode} {field.field_type}) は Storage Write API で扱えません。")
+        message_proto.field.add(
+            name=field.name,
+            number=number,
+            type=_PROTO_TYPE_MAP.get(_bq_type_mapper(field.field_type), descriptor_pb2.FieldDescriptorProto.TYPE_STRING),
+            label=descriptor_pb2.FieldDescriptorProto.LABEL_OPTIONAL,
+        )
+    pool = descriptor_pool.DescriptorPool()
+    pool.Add(file_proto)
+    row_class = message_factory.GetMessageClass(pool.FindMessageTypeByName("mock_mito.MasterRow"))
+    return row_class, message_proto
+
+def _is_null(value) -> bool:
+    """None / NaN / NaT / pd.NA を欠損値として判定する (JSON型の list/dict は対象外)"""
+    if value is None:
+        return True
+    if isinstance(value, (list, dict)):
+        return False
+    return bool(pd.isna(value))
+
+def _to_proto_value(value, bq_type: str):
+    """DataFrameの値を Storage Write API が受け付ける protobuf の値に変換する"""
+    if bq_type == "INT64":
+        return int(value)
+    if bq_type == "FLOAT64":
+        return float(value)
+    if bq_type == "BOOL":
+        return bool(value)
+    if bq_type == "DATE":
+        return (pd.Timestamp(value).date() - _EPOCH_DATE).days
+    if bq_type == "TIMESTAMP":
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None:
+            ts = ts.tz_localize("UTC") # タイムゾーンなしはUTCとして扱う
+        return ts.value // 1000
+    if bq_type == "JSON" and not isinstance(value, str):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def _serialize_rows(schema: List[bigquery.SchemaField], df: pd.DataFrame) -> Tuple[descriptor_pb2.DescriptorProto, List[bytes]]:
+    """DataFrameの各行をテーブルスキーマに対応した protobuf にシリアライズする"""
+    unknown_columns = set(df.columns) - {field.name for field in schema}
+    if unknown_columns:
+        raise ValueError(f"テーブルに存在しないカラムが含まれています: {sorted(unknown_columns)}")
+
+    row_class, descriptor = _build_row_message_class(schema)
+    columns = [(field.name, _bq_type_mapper(field.field_type)) for field in schema if field.name in df.columns]
+    serialized_rows = []
+    for record in df[[name for name, _ in columns]].itertuples(index=False, name=None):
+        row = row_class()
+        for (name, bq_type), value in zip(columns, record):
+            if not _is_null(value):
+                setattr(row, name, _to_proto_value(value, bq_type))
+        serialized_rows.append(row.SerializeToString())
+    return descriptor, serialized_rows
+
+def _append_rows(write_client, stream_name: str, descriptor: descriptor_pb2.DescriptorProto,
+                 serialized_rows: List[bytes]):
+    """シリアライズ済みの行を AppendRows でストリームに書き込み、全ての ack を待つ
+
+    _default ストリームはオフセット指定に対応していないため、オフセットは指定しない。
+    """
+    request_template = bqs_types.AppendRowsRequest(
+        write_stream=stream_name,
+        proto_rows=bqs_types.AppendRowsRequest.ProtoData(
+            writer_schema=bqs_types.ProtoSchema(proto_descriptor=descriptor)
+        ),
+    )
+    append_rows_stream = bqs_writer.AppendRowsStream(write_client, request_template)
+    try:
+        futures = []
+        for offset in range(0, len(serialized_rows), STORAGE_WRITE_BATCH_ROWS):
+            request = bqs_types.AppendRowsRequest(
+                proto_rows=bqs_types.AppendRowsRequest.ProtoData(
+                    rows=bqs_types.ProtoRows(serialized_rows=serialized_rows[offset:offset + STORAGE_WRITE_BATCH_ROWS])
+                ),
+            )
+            futures.append(append_rows_stream.send(request))
+        for future in futures:
+            future.result() # 書き込み完了 (ack) を待つ
+    finally:
+        append_rows_stream.close()
+
+def _append_with_default_stream(master_name: str, schema: List[bigquery.SchemaField], df: pd.DataFrame):
+    """Storage Write API の _default ストリーム (コミット済みモード) に行を追加する"""
+    write_client = get_bqwrite_client()
+    descriptor, serialized_rows = _serialize_rows(schema, df)
+    parent = write_client.table_path(config.GOOGLE_CLOUD_PROJECT, config.BIGQUERY_DATASET_ID, master_name)
+    _append_rows(write_client, f"{parent}/streams/_default", descriptor, serialized_rows)
+
 # --- スキーマ定義テーブル操作関数 ---
 
+@functools.lru_cache(maxsize=1)
 def _get_schema_table() -> bigquery.Table:
-    """スキーマ定義テーブルを取得または作成する"""
+    """スキーマ定義テーブルを取得または作成する
+
+    存在確認・作成に成功した結果はキャッシュされ、以降の呼び出しではRPCを発行しない。
+    失敗時は例外がキャッシュされないため、次回呼び出しで再試行される。
+    """
+    client = get_bq_client()
     try:
         table = client.get_table(schema_table_id)
         logger.info(f"スキーマ定義テーブル {schema_table_id} が存在します。")
@@ -140,22 +353,36 @@ def _get_schema_table() -> bigquery.Table:
             logger.error(f"スキーマ定義テーブルの取得中にエラーが発生しました: {e}")
             raise
 
+def get_schema_table_modified() -> datetime | None:
+    """スキーマ定義テーブルの最終更新日時を取得する (テーブルのメタデータのみを取得する軽量なRPC)
+
+    スキーマ定義のキャッシュが古くなっていないかを確認するために使用する。
+    """
+    _get_schema_table() # テーブルが存在しなければ作成
+    return get_bq_client().get_table(schema_table_id).modified
+
 def load_all_schema_definitions() -> Dict[str, Dict]:
     """BigQueryから全てのスキーマ定義を読み込む"""
+    client = get_bq_client()
     _get_schema_table() # テーブルが存在しなければ作成
     logger.info(f"BigQueryからスキーマ定義を読み込み中: {schema_table_id}")
     schemas = {}
     try:
         query = f"SELECT master_name, schema_definition FROM `{schema_table_id}`"
-        query_job = client.query(query)
+        # 1回のクエリで全件を Arrow 形式のまま取得し、pandas への変換を省略する
+        arrow_table = client.query(query).to_arrow(
+            bqstorage_client=get_bqstorage_client(),
+            create_bqstorage_client=False,
+        )
 
-        for row in query_job:
-            master_name = row["master_name"]
+        for master_name, schema_def_str in zip(arrow_table.column("master_name").to_pylist(),
+                                                arrow_table.column("schema_definition").to_pylist()):
             # JSON型のカラムは文字列として取得されるため、パースする
             try:
-                schema_def_str = row["schema_definition"]
-                if schema_def_str: # Nullや空文字列でないことを確認
-                     schemas[master_name] = json.loads(schema_def_str)
+                if isinstance(schema_def_str, dict): # 取得時に既にパース済みの場合
+                     schemas[master_name] = schema_def_str
+                elif schema_def_str: # Nullや空文字列でないことを確認
+                     schemas[master_name] = _json_loads(schema_def_str)
                 # else:
                      # print(f"警告: master_name '{master_name}' の schema_definition が空です。") # 警告表示をコメントアウト
             except json.JSONDecodeError as json_err:
@@ -169,18 +396,36 @@ def load_all_schema_definitions() -> Dict[str, Dict]:
         logger.error(f"BigQueryからのスキーマ定義読み込み中にエラーが発生しました: {e}")
         return {} # エラー時は空辞書を返す
 
-def save_schema_definition(master_name: str, schema_definition: Dict):
+def save_schema_definition(master_name: str, schema_definition: Dict, client: bigquery.Client | None = None):
     """スキーマ定義をBigQueryに保存（上書き）する"""
+    save_schema_definitions_bulk([(master_name, schema_definition)], client=client)
+
+def save_schema_definitions_bulk(items: List[Tuple[str, Dict]], client: bigquery.Client | None = None):
+    """複数のスキーマ定義を1回のMERGE文でBigQueryに保存（上書き）する
+
+    同じマスター名が複数含まれる場合は後のものを優先する。
+    client を省略した場合は共有のクライアントを使用する。
+    """
+    client = client or get_bq_client()
     _get_schema_table() # テーブルが存在しなければ作成
-    logger.info(f"スキーマ定義をBigQueryに保存中: {master_name}")
+    # MERGEは1つの対象行に複数のソース行が一致するとエラーになるため、マスター名で重複を除く
+    definitions = dict(items)
+    if not definitions:
+        return
+    master_names = list(definitions.keys())
+    logger.info(f"スキーマ定義をBigQueryに保存中: {master_names}")
     try:
         # スキーマ定義をJSON文字列に変換
-        schema_def_json = json.dumps(schema_definition, ensure_ascii=False)
+        schema_def_jsons = [json.dumps(definitions[name], ensure_ascii=False) for name in master_names]
 
         # MERGE文を使用してUPSERT（存在すればUPDATE、存在しなければINSERT）を行う
+        # マスター名とスキーマ定義は同じ順序の配列パラメータとして渡し、OFFSETで対応付ける
         merge_sql = f"""
         MERGE `{schema_table_id}` T
-        USING (SELECT @master_name AS master_name, @schema_def AS schema_definition) S
+        USING (
+          SELECT master_name, PARSE_JSON(@schema_defs[OFFSET(pos)]) AS schema_definition
+          FROM UNNEST(@master_names) AS master_name WITH OFFSET pos
+        ) S
         ON T.master_name = S.master_name
         WHEN MATCHED THEN
           UPDATE SET schema_definition = S.schema_definition
@@ -190,20 +435,21 @@ def save_schema_definition(master_name: str, schema_definition: Dict):
 
         job_config = bigquery.QueryJobConfig(
             query_parameters=[
-                bigquery.ScalarQueryParameter("master_name", "STRING", master_name),
-                bigquery.ScalarQueryParameter("schema_def", "JSON", schema_def_json),
+                bigquery.ArrayQueryParameter("master_names", "STRING", master_names),
+                bigquery.ArrayQueryParameter("schema_defs", "STRING", schema_def_jsons),
             ]
         )
 
         query_job = client.query(merge_sql, job_config=job_config)
         query_job.result() # クエリの完了を待つ
-        logger.info(f"スキーマ定義の保存完了: {master_name}")
+        logger.info(f"スキーマ定義の保存完了: {master_names}")
     except Exception as e:
-        logger.error(f"スキーマ定義の保存中にエラーが発生しました ({master_name}): {e}")
+        logger.error(f"スキーマ定義の保存中にエラーが発生しました ({master_names}): {e}")
         raise
 
-def delete_schema_definition(master_name: str):
-    """スキーマ定義をBigQueryから削除する"""
+def delete_schema_definition(master_name: str, client: bigquery.Client | None = None):
+    """スキーマ定義をBigQueryから削除する (client を省略した場合は共有のクライアントを使用する)"""
+    client = client or get_bq_client()
     _get_schema_table() # テーブルが存在しなければ作成 (エラー防止)
     logger.info(f"スキーマ定義をBigQueryから削除中: {master_name}")
     try:
@@ -227,8 +473,11 @@ def _bq_type_mapper(app_type: str) -> str:
     type_map = {
         "STRING": "STRING",
         "INTEGER": "INT64", # または INTEGER
+        "INT64": "INT64",
         "FLOAT": "FLOAT64", # または FLOAT
+        "FLOAT64": "FLOAT64",
         "BOOLEAN": "BOOL", # または BOOLEAN
+        "BOOL": "BOOL",
         "DATE": "DATE",
         "TIMESTAMP": "TIMESTAMP",
         "JSON": "JSON",
@@ -236,8 +485,30 @@ def _bq_type_mapper(app_type: str) -> str:
     }
     return type_map.get(app_type.upper(), "STRING") # 不明な場合はSTRING
 
+def _bq_mode_mapper(constraints) -> str:
+    """カラムの制約リストからBigQueryのモードを決定する (NOT NULL制約があれば REQUIRED)"""
+    if isinstance(constraints, list) and "NOT NULL" in (c.upper() for c in constraints):
+        return "REQUIRED"
+    return "NULLABLE"
+
+# BigQueryの型 (_bq_type_mapper 変換後) と Arrow の型の対応
+_PA_TYPE_MAP = {
+    "STRING": pa.string(),
+    "INT64": pa.int64(),
+    "FLOAT64": pa.float64(),
+    "BOOL": pa.bool_(),
+    "DATE": pa.date32(),
+    "TIMESTAMP": pa.timestamp("us", tz="UTC"),
+    "JSON": pa.string(), # JSON型は文字列としてロードする
+}
+
+def _pa_type_mapper(app_type: str) -> pa.DataType:
+    """アプリケーション内の型名をArrowの型に変換する"""
+    return _PA_TYPE_MAP.get(_bq_type_mapper(app_type), pa.string()) # 不明な場合はstring
+
 def create_data_table(master_name: str, schema_definition: Dict):
     """スキーマ定義に基づいて新しいデータテーブルをBigQueryに作成する"""
+    client = get_bq_client()
     table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{master_name}"
     logger.info(f"データテーブルを作成中: {table_id}")
 
@@ -268,8 +539,7 @@ def create_data_table(master_name: str, schema_definition: Dict):
                 raise ValueError("カラム定義に名前が指定されていません。")
 
             bq_type = _bq_type_mapper(app_type)
-            # NOT NULL制約があれば REQUIRED に設定
-            mode = "REQUIRED" if "NOT NULL" in [c.upper() for c in constraints] else "NULLABLE"
+            mode = _bq_mode_mapper(constraints)
 
             bq_schema.append(bigquery.SchemaField(col_name, bq_type, mode=mode))
 
@@ -284,8 +554,27 @@ def create_data_table(master_name: str, schema_definition: Dict):
         logger.error(f"データテーブル {table_id} の作成に失敗しました: {create_error}")
         raise
 
+# 型ごとのダミー値の生成関数 (引数はカラム名)
+_DUMMY_FACTORIES = {
+    "STRING": lambda col_name: f"dummy_{col_name}",
+    "INTEGER": lambda col_name: 0,
+    "FLOAT": lambda col_name: 0.0,
+    "BOOLEAN": lambda col_name: False,
+    # BigQueryは 'YYYY-MM-DD' 形式の文字列を受け付ける
+    "DATE": lambda col_name: date.today().isoformat(),
+    # BigQueryは 'YYYY-MM-DD HH:MM:SS[.ffffff][+HH:MM]' 形式。UTC推奨
+    "TIMESTAMP": lambda col_name: datetime.now(timezone.utc).isoformat(sep=" "),
+    # BigQueryはJSON文字列またはdictを受け付ける (insert_rows_jsonの場合)
+    "JSON": lambda col_name: {"dummy_key": f"value_for_{col_name}"},
+}
+
+def _unknown_dummy(col_name: str) -> str:
+    """未対応の型のダミー値"""
+    return "unknown_type_dummy"
+
 def insert_dummy_data(master_name: str, schema_definition: Dict):
     """指定されたデータテーブルに型に基づいたダミーデータを1行挿入する"""
+    client = get_bq_client()
     table_id = f"{config.GOOGLE_CLOUD_PROJECT}.{config.BIGQUERY_DATASET_ID}.{master_name}"
     logger.info(f"ダミーデータを挿入中: {table_id}")
     columns = schema_definition.get("columns", [])
@@ -294,51 +583,31 @@ def insert_dummy_data(master_name: str, schema_definition: Dict):
         return
 
     # ダミーデータ行を作成
-    dummy_row = {}
-    from datetime import datetime, date
-    import json
-
-    for col_def in columns:
-        col_name = col_def.get("name")
-        app_type = col_def.get("type", "STRING").upper()
-        constraints = col_def.get("constraints", [])
-        is_required = "NOT NULL" in [c.upper() for c in constraints]
-
-        if not col_name:
-            continue # 名前がないカラムはスキップ
-
-        # 型に応じたダミー値を生成
-        dummy_value = None
-        if app_type == "STRING":
-            dummy_value = f"dummy_{col_name}"
-        elif app_type == "INTEGER":
-            dummy_value = 0
-        elif app_type == "FLOAT":
-            dummy_value = 0.0
-        elif app_type == "BOOLEAN":
-            dummy_value = False
-        elif app_type == "DATE":
-            # BigQueryは 'YYYY-MM-DD' 形式の文字列を受け付ける
-            dummy_value = date.today().isoformat()
-        elif app_type == "TIMESTAMP":
-            # BigQueryは 'YYYY-MM-DD HH:MM:SS[.ffffff][+HH:MM]' 形式。UTC推奨
-            dummy_value = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f UTC')
-        elif app_type == "JSON":
-            # BigQueryはJSON文字列またはdictを受け付ける (insert_rows_jsonの場合)
-            dummy_value = {"dummy_key": f"value_for_{col_name}"}
-        else:
-            dummy_value = "unknown_type_dummy"
-
-        # REQUIRED なのに値が None の場合 (通常は発生しないはずだが念のため)
-        if is_required and dummy_value is None:
-             logger.warning(f"警告: REQUIREDカラム '{col_name}' のダミー値が生成できませんでした。デフォルト値を使用します。")
-             if app_type == "STRING": dummy_value = ""
-             elif app_type == "INTEGER": dummy_value = 0
-             # ... 他の型も必要に応じてデフォルト値設定
+    # 名前がないカラムはスキップし、型に応じたダミー値を生成する
+    dummy_row = {
+        col_def["name"]: _DUMMY_FACTORIES.get(col_def.get("type", "STRING").upper(), _unknown_dummy)(col_def["name"])
+        for col_def in columns
+        if col_def.get("name")
+    }
 
-        dummy_row[col_name] = dummy_value
+    # データを挿入 (Storage Write API が使えない場合は insert_rows_json で挿入する)
+    if bigquery_storage is not None:
+        try:
+            schema = [
+                bigquery.SchemaField(
+                    col_def["name"],
+                    _bq_type_mapper(col_def.get("type", "STRING")),
+                    mode=_bq_mode_mapper(col_def.get("constraints")),
+                )
+                for col_def in columns
+                if col_def.get("name")
+            ]
+            _append_with_default_stream(master_name, schema, pd.DataFrame([dummy_row]))
+            logger.info(f"ダミーデータの挿入成功 (Storage Write API): {table_id}")
+            return
+        except Exception as e:
+            logger.warning(f"Storage Write APIでのダミーデータ挿入に失敗したため、insert_rows_json で挿入します: {e}")
 
-    # データを挿入
     try:
         errors = client.insert_rows_json(table_id, [dummy_row])
         if errors == []:
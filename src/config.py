@@ -17,6 +17,14 @@ BIGQUERY_SCHEMA_TABLE_ID = os.getenv("BIGQUERY_SCHEMA_TABLE_ID")
 
 # DLP APIリージョン
 DLP_API_LOCATION = os.getenv("DLP_API_LOCATION", "global") # デフォルトはglobal
+# DLP APIによる検査を有効にするか (未設定の場合はダミー検査)
+DLP_INSPECTION_ENABLED = os.getenv("DLP_INSPECTION_ENABLED", "false").lower() == "true"
+# DLP APIの1リクエストで検査する行数
+DLP_BATCH_SIZE = int(os.getenv("DLP_BATCH_SIZE", "500"))
+# DLP APIへの同時リクエスト数 (DLP APIのクォータに合わせて調整する)
+DLP_MAX_WORKERS = int(os.getenv("DLP_MAX_WORKERS", "8"))
+# データ検査で詳細を保持する違反の最大件数 (超過分は件数のみ TRUNCATED として記録する)
+MAX_VIOLATIONS = int(os.getenv("MAX_VIOLATIONS", "1000"))
 
 # LLM APIエンドポイント (Vertex AI)
 LLM_API_ENDPOINT = os.getenv("LLM_API_ENDPOINT")
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 import pandas as pd
 from . import schema_manager, bigquery_client, inspection_service
@@ -14,6 +16,10 @@ def save_master_data(master_name: str, df: pd.DataFrame):
     """
     マスターデータを検査し、問題なければBigQueryに保存する。
     要件定義 3.4 および 4.2 に関連。
+
+    (成功したか, 結果) を返す。失敗時の結果は以下のいずれか。
+    - {"type": "inspection_violation", "details": [違反, ...]}: 検査で違反が検出された (保存していない)
+    - {"type": "save_error", "message": str}: BigQueryへの保存中にエラーが発生した
     """
     logger.info(f"マスター '{master_name}' の保存処理を開始します...")
     schema = schema_manager.get_schema(master_name)
@@ -21,28 +27,46 @@ def save_master_data(master_name: str, df: pd.DataFrame):
         logger.error(f"マスター '{master_name}' のスキーマ定義が見つかりません。保存処理を中止します。")
         raise ValueError(f"Schema not found for master: {master_name}")
 
-    # inspection_serviceを使用してデータを検査
-    # InspectionServiceのインスタンス化が必要
-    inspector = inspection_service.InspectionService()
-    violations = inspector.inspect_data(df, schema)
+    # inspection_serviceを使用してデータを検査 (共有インスタンスを使用)
+    # 同じスキーマ・同じ内容のDataFrameを検査済みであれば、その結果を再利用する
+    schema_hash = hashlib.sha256(json.dumps(schema, sort_keys=True, ensure_ascii=False).encode()).digest()
+    violations = df.mito_inspection.get(schema_hash)
+    if violations is None:
+        inspector = inspection_service.get_default()
+        violations = inspector.inspect_data(df, schema)
+        # API呼び出しエラーは一時的な可能性があるため、キャッシュせず次回も検査する
+        if violations.empty or not violations["finding"].astype(str).str.endswith("_API_ERROR").any():
+            df.mito_inspection.set(schema_hash, violations)
+    else:
+        logger.info("検査済みのデータのため、前回の検査結果を使用します。")
 
-    if not violations:
+    if violations.empty:
         logger.info(f"データ検査の結果、問題ありませんでした。BigQueryへの保存を開始します。")
         try:
-            bigquery_client.save_data_to_bigquery(master_name, df)
+            # 整数型のカラムは Int64 に変換してから書き込む (object 型のままだと Arrow の INT64 に変換できない)
+            integer_columns = {
+                col: pd.to_numeric(df[col], errors='coerce').astype("Int64")
+                for col in inspection_service.compile_schema(schema).type_check_targets(df)
+            }
+            # 1回のロードジョブ (Parquet) でまとめて上書きする
+            bigquery_client.save_data_to_bq(master_name, df.assign(**integer_columns))
             logger.info(f"マスター '{master_name}' の保存が成功しました。")
+            return True, None
         except Exception as e:
             logger.error(f"BigQueryへの保存中にエラーが発生しました: {e}", exc_info=True)
             # 保存失敗時のハンドリング (例: リトライ、エラー通知など)
-            raise # エラーを再スローして呼び出し元に通知
+            return False, {"type": "save_error", "message": str(e)}
     else:
         logger.warning(f"データ検査の結果、{len(violations)} 件の違反が検出されました。保存は行いません。")
+        truncated = violations[violations["finding"] == inspection_service.TRUNCATED_FINDING]
+        for details in truncated["details"]:
+            logger.warning(f"違反件数が上限を超えたため、一部の違反の詳細を省略しました: {details}")
         logger.warning("違反の詳細:")
-        for viol in violations:
+        for viol in violations.to_dict("records"):
             logger.warning(f"  - {viol}")
         # 違反があった場合の処理 (例: ユーザーへの通知、修正の要求など)
-        # ここでは例外を発生させて処理を中断させる
-        raise ValueError(f"Data inspection failed for master '{master_name}'. Violations found: {violations}")
+        # 保存は行わず、違反の一覧を呼び出し元に返す
+        return False, {"type": "inspection_violation", "details": violations.to_dict("records")}
 
 # --- マスター定義関連の処理 (app.pyから呼び出す用) ---
 def get_master_list():
@@ -51,28 +75,27 @@ def get_master_list():
 def get_master_schema(master_name: str):
     return schema_manager.get_schema(master_name)
 
-def create_new_master(master_name: str, schema_definition: dict):
+def create_new_master(master_name: str, columns: list):
     """
     新しいマスター定義を登録し、対応するBigQueryテーブルを作成し、ダミーデータを挿入する。
     要件定義 4.1 に関連。
+    BigQueryへのアクセスは bigquery_client の共有クライアント (get_bq_client) を使用する。
     """
-    # BigQueryClientのインスタンス化が必要
-    bq_client = bigquery_client.BigQueryClient()
-
     try:
         # 1. スキーママネージャーに登録 & BigQueryにスキーマ保存
-        schema_manager.register_schema(bq_client, master_name, schema_definition)
+        schema_manager.add_master(master_name, columns)
+        schema_definition = schema_manager.get_schema(master_name)
         logger.info(f"スキーマ定義 '{master_name}' を保存しました。")
 
         # 2. BigQueryにデータテーブルを作成
         try:
-            bq_client.create_data_table(master_name, schema_definition)
+            bigquery_client.create_data_table(master_name, schema_definition)
             logger.info(f"データテーブル '{master_name}' を作成しました。")
         except Exception as e:
             logger.error(f"データテーブル '{master_name}' の作成に失敗しました: {e}", exc_info=True)
             # ロールバック処理: 登録したスキーマ定義を削除
             try:
-                schema_manager.delete_schema(bq_client, master_name)
+                schema_manager.delete_master(master_name)
                 logger.info(f"ロールバック: スキーマ定義 '{master_name}' を削除しました。")
             except Exception as rollback_e:
                 logger.error(f"ロールバック中にエラーが発生しました: {rollback_e}", exc_info=True)
@@ -80,7 +103,7 @@ def create_new_master(master_name: str, schema_definition: dict):
 
         # 3. ダミーデータを挿入 (任意、エラーでも処理は止めないことが多い)
         try:
-            bq_client.insert_dummy_data(master_name, schema_definition)
+            bigquery_client.insert_dummy_data(master_name, schema_definition)
             logger.info(f"ダミーデータをテーブル '{master_name}' に挿入しました。")
         except Exception as e:
             # ダミーデータ挿入失敗は警告に留めることが多い
@@ -94,9 +117,8 @@ def create_new_master(master_name: str, schema_definition: dict):
 
 def update_master_schema(master_name: str, new_schema_definition: dict):
     """マスターのスキーマ定義を更新する"""
-    bq_client = bigquery_client.BigQueryClient()
     try:
-        schema_manager.update_schema(bq_client, master_name, new_schema_definition)
+        schema_manager.update_schema(master_name, new_schema_definition.get("columns", []))
         logger.info(f"マスター '{master_name}' のスキーマ定義を更新しました。BigQuery側のデータテーブルスキーマ変更は別途必要になる場合があります。")
         # 注意: この関数はスキーマ定義の *メタデータ* を更新するだけ。
         # BigQueryのテーブルスキーマ自体の変更 (ALTER TABLE) はここでは行わない。
@@ -107,9 +129,8 @@ def update_master_schema(master_name: str, new_schema_definition: dict):
 
 def delete_master_definition(master_name: str):
     """マスターのスキーマ定義を削除する"""
-    bq_client = bigquery_client.BigQueryClient()
     try:
-        schema_manager.delete_schema(bq_client, master_name)
+        schema_manager.delete_master(master_name)
         logger.info(f"マスター '{master_name}' の定義を削除しました。BigQuery側のデータテーブルは手動で削除してください。")
         # 注意: この関数はスキーマ定義の *メタデータ* を削除するだけ。
         # BigQueryのテーブル自体は削除しない。
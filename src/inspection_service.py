@@ -1,5 +1,9 @@
+import functools
+import hashlib
 import logging
 import pandas as pd
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, Any, Tuple, List
 # from google.cloud import dlp_v2 # DLPクライアント (別途インストール・設定が必要)
 # from google.cloud import aiplatform # Vertex AIクライアント (別途インストール・設定が必要)
@@ -22,6 +26,136 @@ from google.protobuf.struct_pb2 import Value
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
+# DLP APIの検査設定
+_DLP_INSPECT_CONFIG = {
+    "info_types": [{"name": "EMAIL_ADDRESS"}, {"name": "PHONE_NUMBER"}],
+    "min_likelihood": dlp_v2.Likelihood.POSSIBLE,
+    "include_quote": True,
+}
+
+# DLP検査の対象とする型 (自由記述で機密情報が含まれ得る型)
+_DLP_TARGET_TYPES = {"STRING", "JSON"}
+# 整数であることを検査する型
+_INTEGER_TYPES = {"INTEGER", "INT64"}
+
+class CompiledSchema:
+    """検査用に変換済みのスキーマ定義
+
+    スキーマ定義 (JSON) の解釈は compile_schema() でスキーマごとに1回だけ行い、
+    検査のたびにカラム定義を走査しないようにする。
+    """
+
+    def __init__(self, column_types: Dict[str, str]):
+        self.column_types = column_types # カラム名 -> データ型 (大文字)
+        self.integer_columns = frozenset(name for name, type_ in column_types.items() if type_ in _INTEGER_TYPES)
+
+    def dlp_targets(self, df: pd.DataFrame) -> List[str]:
+        """DLP検査が必要なカラム (文字列系の型、またはスキーマに定義されていないカラム)"""
+        return [col for col in df.columns if self.column_types.get(col, "STRING") in _DLP_TARGET_TYPES]
+
+    def type_check_targets(self, df: pd.DataFrame) -> List[str]:
+        """整数型の検査が必要なカラム (スキーマで整数型と定義されているカラム)"""
+        return [col for col in df.columns if col in self.integer_columns]
+
+@functools.lru_cache(maxsize=128)
+def _compile_columns(columns: Tuple[Tuple[str, str], ...]) -> CompiledSchema:
+    return CompiledSchema({name: str(type_).upper() for name, type_ in columns})
+
+def compile_schema(schema: dict) -> CompiledSchema:
+    """スキーマ定義を検査用に変換する (同じカラム定義に対しては変換済みのものを再利用する)"""
+    return _compile_columns(tuple((col.get("name"), col.get("type", "")) for col in schema.get("columns", [])))
+
+# 違反一覧 (DataFrame) のカラム
+VIOLATION_COLUMNS = ["row_index", "column_name", "finding", "details"]
+# 詳細を保持する違反件数の上限 (既定値)
+MAX_VIOLATIONS = config.MAX_VIOLATIONS
+# 上限を超えて省略された違反を示す finding
+TRUNCATED_FINDING = "TRUNCATED"
+
+def _violations_frame(row_index, column_name, finding, details) -> pd.DataFrame:
+    """違反情報 (カラムごとの配列) から違反一覧のDataFrameを作成する
+
+    違反1件ごとに辞書を作らず、カラム単位の配列で保持することでメモリ使用量を抑える。
+    column_name / finding はスカラー値も指定できる (全行で同じ値になる)。
+    違反が0件の場合も .str アクセサが使えるよう、カラムは object 型とする。
+    """
+    return pd.DataFrame(
+        {"row_index": row_index, "column_name": column_name, "finding": finding, "details": details},
+        columns=VIOLATION_COLUMNS,
+        dtype=object,
+    )
+
+# 違反がない場合に返す共有の空の違反一覧 (違反なしが大半のため、毎回DataFrameを作らない)
+# 呼び出し元で変更しないこと
+_EMPTY_VIOLATIONS = _violations_frame([], [], [], [])
+
+def _error_violation(finding: str, details: str) -> pd.DataFrame:
+    """検査全体のエラーを示す違反一覧 (row_index は -1)"""
+    return _violations_frame([-1], ["N/A"], [finding], [details])
+
+def _truncated_violation(details: str, column_name: str = "N/A") -> pd.DataFrame:
+    """上限件数を超えて違反の詳細を省略したことを示す違反一覧 (row_index は -1)"""
+    return _violations_frame([-1], [column_name], [TRUNCATED_FINDING], [details])
+
+def _suppressed_violation(suppressed: int, column_name: str = "N/A") -> pd.DataFrame:
+    """省略した違反の件数を示す違反一覧"""
+    return _truncated_violation(f"{suppressed} more violations suppressed", column_name)
+
+def _concat_violations(frames: List[pd.DataFrame], max_violations: int) -> pd.DataFrame:
+    """複数の違反一覧を結合し、上限件数までに切り詰める
+
+    TRUNCATED の記録は上限件数に含めず末尾に残し、切り詰めた件数も TRUNCATED として記録する。
+    """
+    frames = [frame for frame in frames if frame is not _EMPTY_VIOLATIONS and not frame.empty]
+    if not frames:
+        return _EMPTY_VIOLATIONS
+    if len(frames) == 1 and len(frames[0]) <= max_violations:
+        return frames[0] # 結合・切り詰めが不要な場合はコピーしない
+    combined = pd.concat(frames, ignore_index=True)
+    is_summary = (combined["finding"] == TRUNCATED_FINDING).to_numpy()
+    details = combined[~is_summary]
+    summaries = [combined[is_summary]]
+    if len(details) > max_violations:
+        summaries.append(_suppressed_violation(len(details) - max_violations))
+    return pd.concat([details.head(max_violations), *summaries], ignore_index=True)
+
+@pd.api.extensions.register_dataframe_accessor("mito_inspection")
+class InspectionCacheAccessor:
+    """DataFrameに検査結果をキャッシュするアクセサ (df.mito_inspection)
+
+    キャッシュは DataFrame オブジェクト自体に保持されるため、copy() されたDataFrameには引き継がれない。
+    インプレースで変更された場合に備え、取得時にはデータ内容のハッシュも照合する。
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._df = df
+        self._key = None
+        self._violations = None
+
+    def _fingerprint(self):
+        """カラム名とデータ内容 (インデックス含む) のハッシュ値 (ハッシュ化できない値を含む場合は None)"""
+        try:
+            row_hashes = pd.util.hash_pandas_object(self._df, index=True).values.tobytes()
+        except TypeError:
+            return None
+        return hashlib.sha256(repr(list(self._df.columns)).encode() + row_hashes).digest()
+
+    def get(self, schema_hash: bytes):
+        """同じスキーマ・同じ内容で検査済みであれば検査結果を返す (未検査の場合は None)"""
+        if self._key is None or self._key[0] != schema_hash:
+            return None
+        if self._fingerprint() != self._key[1]:
+            return None
+        return self._violations
+
+    def set(self, schema_hash: bytes, violations):
+        """検査結果を保存する"""
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            return
+        self._key = (schema_hash, fingerprint)
+        self._violations = violations
+
 class InspectionService:
     """データ検査を担当するサービスクラス"""
 
@@ -29,90 +163,179 @@ class InspectionService:
         # DLPクライアントの初期化
         self.dlp_client = dlp_v2.DlpServiceClient()
         self.dlp_parent = f"projects/{config.GOOGLE_CLOUD_PROJECT}/locations/{config.DLP_API_LOCATION}"
+        self._dlp_batch_size = config.DLP_BATCH_SIZE # 1リクエストあたりの行数
+        self._dlp_max_workers = config.DLP_MAX_WORKERS # 同時リクエスト数
 
         # Vertex AI Predictionクライアントの初期化
         client_options = ClientOptions(api_endpoint=config.LLM_API_ENDPOINT)
         self.prediction_client = PredictionServiceClient(client_options=client_options)
         self.llm_endpoint = f"projects/{config.GOOGLE_CLOUD_PROJECT}/locations/us-central1/endpoints/{config.LLM_MODEL_NAME}" # リージョンは環境に合わせて変更
 
-    def inspect_data_dlp(self, df: pd.DataFrame, schema: dict) -> list:
-        """DLP APIを使用してデータフレーム内の機密データを検査する (ダミー実装)"""
+    def inspect_data_dlp(self, df: pd.DataFrame, schema: dict,
+                         max_violations: int = MAX_VIOLATIONS) -> pd.DataFrame:
+        """DLP APIを使用してデータフレーム内の機密データを検査する (DLP_INSPECTION_ENABLED でなければダミー実装)"""
+        # 検査対象のカラムがなければデータに触れずに終了する
+        targets = compile_schema(schema).dlp_targets(df)
+        if not targets:
+            return _EMPTY_VIOLATIONS
+        if config.DLP_INSPECTION_ENABLED:
+            return self._inspect_data_dlp_api(df[targets], max_violations)
         logger.info("データ検査を開始 (ダミー実装)...")
-        violations = []
-        # ここに実際のDLP API呼び出しロジックを実装する
-        # 例: dfを適切な形式に変換し、dlp_client.inspect_contentを呼び出す
         # ダミーとして、'email'列があれば違反とする
-        if 'email' in df.columns:
-            for index, row in df.iterrows():
-                if pd.notna(row['email']): # NaNでないことを確認
-                    violations.append({
-                        "row_index": index,
-                        "column_name": 'email',
-                        "finding": "EMAIL_ADDRESS (dummy)",
-                        "details": f"Found potentially sensitive data in row {index}, column 'email'."
-                    })
-        # logger.info(f"DLP検査完了 (ダミー): {len(violations)}件の違反候補")
+        # 行ごとのループ (iterrows) は行わず、列単位のマスクで違反行を特定する
+        if 'email' not in targets:
+            return _EMPTY_VIOLATIONS
+        bad = df['email'].notna().to_numpy() # NaNでない行
+        if not bad.any():
+            return _EMPTY_VIOLATIONS
+        bad_idx = df.index[bad][:max_violations]
+        # logger.info(f"DLP検査完了 (ダミー): {len(bad_idx)}件の違反候補")
+        violations = _violations_frame(
+            bad_idx,
+            'email',
+            "EMAIL_ADDRESS (dummy)",
+            [f"Found potentially sensitive data in row {index}, column 'email'." for index in bad_idx],
+        )
+        suppressed = int(bad.sum()) - len(bad_idx)
+        if suppressed > 0:
+            violations = pd.concat([violations, _suppressed_violation(suppressed, 'email')], ignore_index=True)
         return violations
 
-    def inspect_data_llm(self, df: pd.DataFrame, schema: dict) -> list:
+    def _inspect_data_dlp_api(self, df: pd.DataFrame, max_violations: int) -> pd.DataFrame:
+        """DLP APIでデータフレームを検査する (_dlp_batch_size 行ずつTable形式でまとめて送信する)"""
+        logger.info(f"DLP APIによるデータ検査を開始: {len(df)} 行, バッチサイズ {self._dlp_batch_size}, 同時実行数 {self._dlp_max_workers}")
+        chunks = [df.iloc[start:start + self._dlp_batch_size] for start in range(0, len(df), self._dlp_batch_size)]
+        frames = [None] * len(chunks)
+        # 先頭から連続して完了したバッチの数と、その違反件数
+        # 上限の判定はこの連続部分のみで行い、常に行順で先頭の違反が残るようにする
+        completed = 0
+        found = 0
+        # 各バッチの inspect_content 呼び出しはネットワーク待ちが主のため、スレッドで並行して送信する (dlp_client はスレッドセーフ)
+        with ThreadPoolExecutor(max_workers=max(1, min(self._dlp_max_workers, len(chunks)))) as executor:
+            futures = {executor.submit(self._inspect_chunk_dlp, chunk): i for i, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                frames[futures[future]] = future.result()
+                while completed < len(frames) and frames[completed] is not None:
+                    found += len(frames[completed])
+                    completed += 1
+                if found >= max_violations: # 上限に達したら未送信のバッチは取り消す
+                    for pending in futures:
+                        pending.cancel()
+                    break
+        # 結果は元の行順 (バッチ順) の連続部分のみを使う
+        frames = frames[:completed]
+        if completed < len(chunks):
+            # 残りのバッチの違反件数は不明なため、検査を打ち切ったことのみ記録する
+            frames.append(_truncated_violation(f"DLP inspection stopped after {found} violations; remaining rows were not inspected"))
+        return _concat_violations(frames, max_violations)
+
+    def _inspect_chunk_dlp(self, chunk: pd.DataFrame) -> pd.DataFrame:
+        """データフレームの一部を1回の inspect_content 呼び出しで検査し、検出結果を違反一覧に変換する"""
+        # セル単位の pd.isna / str 変換を避け、カラム単位で一度に文字列へ変換する (NaN は空文字列)
+        columns = [series.astype(str).where(series.notna(), "").to_numpy() for _, series in chunk.items()]
+        table = dlp_v2.Table(
+            headers=[dlp_v2.FieldId(name=str(col)) for col in chunk.columns],
+            rows=[
+                dlp_v2.Table.Row(values=[dlp_v2.Value(string_value=v) for v in row])
+                for row in zip(*columns)
+            ],
+        )
+        response = self.dlp_client.inspect_content(
+            request={
+                "parent": self.dlp_parent,
+                "inspect_config": _DLP_INSPECT_CONFIG,
+                "item": dlp_v2.ContentItem(table=table),
+            }
+        )
+
+        row_indexes, column_names, findings, details = [], [], [], []
+        for finding in response.result.findings:
+            # 検出位置 (テーブル内の行番号・カラム名) を元のデータフレームの行・カラムに対応付ける
+            for content_location in finding.location.content_locations:
+                record_location = content_location.record_location
+                index = chunk.index[record_location.table_location.row_index]
+                column_name = record_location.field_id.name
+                row_indexes.append(index)
+                column_names.append(column_name)
+                findings.append(finding.info_type.name)
+                details.append(f"Found {finding.info_type.name} (likelihood: {finding.likelihood.name}) in row {index}, column '{column_name}'.")
+        if not row_indexes:
+            return _EMPTY_VIOLATIONS
+        return _violations_frame(row_indexes, column_names, findings, details)
+
+    def inspect_data_llm(self, df: pd.DataFrame, schema: dict,
+                         max_violations: int = MAX_VIOLATIONS) -> pd.DataFrame:
         """LLM APIを使用してデータフレーム内の項目がスキーマ定義に準拠しているか検査する (ダミー実装)"""
         # logger.info("スキーマ準拠性検査を開始 (ダミー実装)...")
-        violations = []
+        frames = []
         # ここに実際のLLM API呼び出しロジックを実装する
         # 例: スキーマ定義とデータ行をプロンプトに含め、LLMに評価させる
-        # ダミーとして、'age'列が数値でない、または負の値であれば違反とする
-        if 'age' in df.columns and 'int' in schema.get('age', {}).get('type', '').lower():
-            for index, row in df.iterrows():
-                age = row['age']
-                if pd.notna(age): # NaNでないことを確認
-                    try:
-                        age_val = int(age)
-                        if age_val < 0:
-                            violations.append({
-                                "row_index": index,
-                                "column_name": 'age',
-                                "finding": "INVALID_VALUE (dummy)",
-                                "details": f"Age cannot be negative in row {index}. Value: {age_val}"
-                            })
-                    except (ValueError, TypeError):
-                        violations.append({
-                            "row_index": index,
-                            "column_name": 'age',
-                            "finding": "INVALID_TYPE (dummy)",
-                            "details": f"Age must be an integer in row {index}. Value: {age}"
-                        })
-        # logger.info(f"LLM検査完了 (ダミー): {len(violations)}件の違反候補")
-        return violations
+        # ダミーとして、整数型のカラムが数値でない場合、'age'列が負の値の場合に違反とする
+        for col in compile_schema(schema).type_check_targets(df):
+            # 数値への変換は列単位で一度だけ行い、変換できなかった値は NaN とする
+            raw_values = df[col]
+            numbers = pd.to_numeric(raw_values, errors='coerce')
+            # NaNでないのに数値に変換できない値、または整数でない数値 (1.5 など) を違反とする
+            # (保存時の Int64 への変換が失敗しないよう、ここで必ず検出する)
+            non_integral = (numbers.notna() & (numbers % 1 != 0)).fillna(False)
+            type_bad = ((numbers.isna() & raw_values.notna()) | non_integral).to_numpy(dtype=bool)
+            # 違反がない場合 (大半のケース) は違反一覧を作らない
+            if type_bad.any():
+                bad_idx = df.index[type_bad][:max_violations]
+                frames.append(_violations_frame(
+                    bad_idx,
+                    col,
+                    "INVALID_TYPE (dummy)",
+                    [f"{col} must be an integer in row {index}. Value: {value}"
+                     for index, value in zip(bad_idx, raw_values[type_bad][:max_violations])],
+                ))
+                suppressed = int(type_bad.sum()) - len(bad_idx)
+                if suppressed > 0:
+                    frames.append(_suppressed_violation(suppressed, col))
+            if col == 'age':
+                negative_bad = numbers.lt(0).fillna(False).to_numpy(dtype=bool)
+                if negative_bad.any():
+                    bad_idx = df.index[negative_bad][:max_violations]
+                    frames.append(_violations_frame(
+                        bad_idx,
+                        'age',
+                        "INVALID_VALUE (dummy)",
+                        [f"Age cannot be negative in row {index}. Value: {int(value)}"
+                         for index, value in zip(bad_idx, numbers[negative_bad][:max_violations])],
+                    ))
+                    suppressed = int(negative_bad.sum()) - len(bad_idx)
+                    if suppressed > 0:
+                        frames.append(_suppressed_violation(suppressed, 'age'))
+        return _concat_violations(frames, max_violations)
+
+    def inspect_data(self, df: pd.DataFrame, schema: dict,
+                     max_violations: int = MAX_VIOLATIONS) -> pd.DataFrame:
+        """データフレームに対してDLPとLLMの両方の検査を実行する
+
+        違反は VIOLATION_COLUMNS をカラムに持つDataFrameで返す (詳細は最大 max_violations 件)。
+        上限を超えた違反は件数のみ finding が TRUNCATED の記録として末尾に含まれる。
+        """
+        frames = []
+        # DLP検査とLLM検査は互いに独立したI/O待ちのため並行して実行する
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            dlp_future = executor.submit(self.inspect_data_dlp, df, schema, max_violations)
+            llm_future = executor.submit(self.inspect_data_llm, df, schema, max_violations)
 
-    def inspect_data(self, df: pd.DataFrame, schema: dict) -> list:
-        """データフレームに対してDLPとLLMの両方の検査を実行する"""
-        all_violations = []
         try:
-            dlp_violations = self.inspect_data_dlp(df, schema)
-            all_violations.extend(dlp_violations)
+            frames.append(dlp_future.result())
         except Exception as e:
             logger.error(f"DLP API呼び出し中にエラー: {e}", exc_info=True)
             # エラーが発生した場合でも、LLM検査は試みる
-            all_violations.append({
-                "row_index": -1, # 全体エラーを示す
-                "column_name": "N/A",
-                "finding": "DLP_API_ERROR",
-                "details": f"Error during DLP inspection: {e}"
-            })
+            frames.append(_error_violation("DLP_API_ERROR", f"Error during DLP inspection: {e}"))
 
         try:
-            llm_violations = self.inspect_data_llm(df, schema)
-            all_violations.extend(llm_violations)
+            frames.append(llm_future.result())
         except Exception as e:
             logger.error(f"LLM API呼び出し中にエラー: {e}", exc_info=True)
-            all_violations.append({
-                "row_index": -1, # 全体エラーを示す
-                "column_name": "N/A",
-                "finding": "LLM_API_ERROR",
-                "details": f"Error during LLM inspection: {e}"
-            })
-
-        if all_violations:
+            frames.append(_error_violation("LLM_API_ERROR", f"Error during LLM inspection: {e}"))
+
+        all_violations = _concat_violations(frames, max_violations)
+        if not all_violations.empty:
             logger.info(f"データ検査完了: {len(all_violations)} 件の違反を検出しました。")
         else:
             logger.info("データ検査完了: 違反はありませんでした。")
@@ -120,26 +343,6 @@ class InspectionService:
         return all_violations
 
     # --- 以下、実際のAPI呼び出しの参考例 (コメントアウト) ---
-    # def _call_dlp_api(self, item_to_inspect):
-    #     """実際のDLP APIを呼び出すメソッド (参考)"""
-    #     try:
-    #         response = self.dlp_client.inspect_content(
-    #             request={
-    #                 "parent": self.dlp_parent,
-    #                 "inspect_config": {
-    #                     "info_types": [{"name": "EMAIL_ADDRESS"}, {"name": "PHONE_NUMBER"}],
-    #                     "min_likelihood": dlp_v2.Likelihood.POSSIBLE,
-    #                     "include_quote": True,
-    #                 },
-    #                 "item": item_to_inspect, # dlp_v2.ContentItem 形式
-    #             }
-    #         )
-    #         return response.result.findings
-    #     except Exception as e:
-    #         # print(f"DLP API呼び出し中にエラー: {e}")
-    #         logger.error(f"DLP API呼び出し中にエラー: {e}", exc_info=True)
-    #         return []
-    #
     # def _call_llm_api(self, prompt):
     #     """実際のVertex AI Prediction APIを呼び出すメソッド (参考)"""
     #     try:
@@ -160,3 +363,12 @@ class InspectionService:
     #         # print(f"LLM API呼び出し中にエラー: {e}")
     #         logger.error(f"LLM API呼び出し中にエラー: {e}", exc_info=True)
     #         return [] 
+
+@st.cache_resource
+def get_default() -> InspectionService:
+    """共有の InspectionService を取得する (プロセス内で1つを共有)
+
+    DLP/Vertex AI のクライアントは gRPC チャネルの確立や認証にコストがかかるため、
+    保存のたびに生成せず使い回す。各クライアントはスレッドセーフ。
+    """
+    return InspectionService()
@@ -1,6 +1,9 @@
 import json
 import logging
 import os
+import threading
+import time
+import streamlit as st
 from . import config, bigquery_client
 from typing import Dict, List, Any, Optional
 
@@ -8,16 +11,58 @@ from typing import Dict, List, Any, Optional
 logger = logging.getLogger(__name__)
 
 # スキーマ定義を格納する辞書 (メモリキャッシュ)
+# 読み取りはロックなしで行うため、更新時は辞書をコピーして差し替える (コピーオンライト)
 _schemas: Dict[str, Dict] = {}
 _initialized = False
+# 初期化・更新処理の排他制御用ロック
+_lock = threading.RLock()
+
+# スキーマ定義テーブルの更新確認の間隔 (秒)
+# 他のプロセスがスキーマ定義を変更した場合も、再起動せずにこの間隔で反映される
+SCHEMA_REVALIDATE_SECONDS = 60
+# 読み込んだスキーマ定義に対応するスキーマ定義テーブルの最終更新日時
+_schemas_table_modified = None
+# 最後に更新確認を行った時刻 (time.monotonic())
+_last_check = 0.0
+
+@st.cache_data(persist="disk")
+def _load_schema_definitions(table_modified=None) -> Dict[str, Dict]:
+    """BigQueryから読み込んだスキーマ定義をディスクに永続化してキャッシュする
+
+    アプリケーション再起動時のBigQueryへの問い合わせを省略するため。
+    スキーマ定義テーブルの最終更新日時をキャッシュのキーとし、テーブルが更新されていれば読み直す。
+    スキーマ定義を変更した場合は _load_schema_definitions.clear() で破棄する。
+    """
+    return bigquery_client.load_all_schema_definitions()
+
+def _get_table_modified():
+    """スキーマ定義テーブルの最終更新日時を取得する (取得できない場合は None)"""
+    try:
+        return bigquery_client.get_schema_table_modified()
+    except Exception as e:
+        logger.warning(f"スキーマ定義テーブルの最終更新日時を取得できませんでした: {e}")
+        return None
+
+def _load_schemas(table_modified):
+    """スキーマ定義を読み込み、メモリキャッシュを差し替える (呼び出し元で _lock を取得していること)"""
+    global _schemas, _schemas_table_modified
+    schemas = _load_schema_definitions(table_modified)
+    if not schemas:
+        # 読み込み失敗時も空辞書が返るため、空の結果はディスクに残さない
+        _load_schema_definitions.clear()
+        # 最終更新日時も記録せず、次回の更新確認 (SCHEMA_REVALIDATE_SECONDS 後) で読み直す
+        table_modified = None
+    _schemas = schemas
+    _schemas_table_modified = table_modified
 
 def _initialize_schemas():
-    """アプリケーション起動時にBigQueryからスキーマ定義を読み込む"""
-    global _schemas, _initialized
+    """BigQueryからスキーマ定義を読み込む (呼び出し元で _lock を取得していること)"""
+    global _schemas, _initialized, _last_check
     if not _initialized:
         logger.info("スキーマ定義の初期化を開始します...")
         try:
-            _schemas = bigquery_client.load_all_schema_definitions()
+            _last_check = time.monotonic()
+            _load_schemas(_get_table_modified())
             _initialized = True
             logger.info(f"スキーマ定義の初期化完了。{len(_schemas)} 件のマスターをロードしました。")
         except Exception as e:
@@ -26,57 +71,102 @@ def _initialize_schemas():
             _schemas = {}
             _initialized = True # 再試行を防ぐために True にする
 
-# モジュール読み込み時に初期化を実行
-_initialize_schemas()
+def _revalidate_schemas():
+    """スキーマ定義テーブルが更新されていれば読み直す (呼び出し元で _lock を取得していること)"""
+    global _last_check
+    if time.monotonic() - _last_check < SCHEMA_REVALIDATE_SECONDS:
+        return # 他のスレッドが確認済み
+    _last_check = time.monotonic()
+    table_modified = _get_table_modified()
+    if table_modified is None or table_modified == _schemas_table_modified:
+        return
+    logger.info("スキーマ定義テーブルが更新されているため、スキーマ定義を読み直します...")
+    try:
+        _load_schemas(table_modified)
+        logger.info(f"スキーマ定義の再読み込み完了。{len(_schemas)} 件のマスターをロードしました。")
+    except Exception as e:
+        # 読み直しに失敗した場合は現在のキャッシュを使い続ける
+        logger.error(f"スキーマ定義の再読み込み中にエラーが発生しました: {e}", exc_info=True)
+
+def ensure_initialized():
+    """スキーマ定義が未読み込みであれば初回アクセス時に読み込む
+
+    モジュール読み込み時のBigQueryへの問い合わせを避けるため、遅延初期化する。
+    初期化済みの場合はロックを取得しない (ダブルチェックロッキング)。
+    SCHEMA_REVALIDATE_SECONDS ごとにスキーマ定義テーブルの最終更新日時を確認し、更新されていれば読み直す。
+    """
+    if _initialized and time.monotonic() - _last_check < SCHEMA_REVALIDATE_SECONDS:
+        return
+    with _lock:
+        if not _initialized:
+            _initialize_schemas()
+        else:
+            _revalidate_schemas()
 
 def get_all_master_names() -> List[str]:
     """登録されているすべてのマスター名を取得する (メモリキャッシュから)"""
-    # _initialize_schemas() # 既に初期化済みのはずだが、念のため呼ぶことも可能
+    ensure_initialized()
     return list(_schemas.keys())
 
 def get_schema(master_name: str) -> Dict[str, Any] | None:
     """指定されたマスターのスキーマ定義を取得する (メモリキャッシュから)"""
-    return _schemas.get(master_name)
-
-def add_master(master_name: str, columns: List[Dict]):
-    """新しいマスターとそのスキーマを登録する"""
-    if master_name in _schemas:
-        raise ValueError(f"マスター '{master_name}' は既に存在します。")
-    # TODO: スキーマのバリデーション (カラム名、型、セキュリティレベルなど)
-    new_schema = {"columns": columns}
-    try:
-        bigquery_client.save_schema_definition(master_name, new_schema)
-        _schemas[master_name] = new_schema # メモリキャッシュも更新
-        print(f"新規マスター '{master_name}' を登録し、BigQueryに保存しました。")
-    except Exception as e:
-        print(f"マスター '{master_name}' の登録・保存中にエラー: {e}")
-        raise # エラーを呼び出し元に伝える
-
-def update_schema(master_name: str, columns: List[Dict]):
-    """既存マスターのスキーマを更新する"""
-    if master_name not in _schemas:
-        raise ValueError(f"マスター '{master_name}' が存在しません。")
-    # TODO: スキーマのバリデーション
-    updated_schema = {"columns": columns}
-    try:
-        bigquery_client.save_schema_definition(master_name, updated_schema)
-        _schemas[master_name] = updated_schema # メモリキャッシュも更新
-        print(f"マスター '{master_name}' のスキーマを更新し、BigQueryに保存しました。")
-    except Exception as e:
-        print(f"マスター '{master_name}' のスキーマ更新・保存中にエラー: {e}")
-        raise
+    ensure_initialized()
+    schemas = _schemas # 差し替えられても参照中の辞書は変更されない
+    return schemas.get(master_name)
 
-def delete_master(master_name: str):
-    """マスター定義を削除する"""
-    if master_name not in _schemas:
-        raise ValueError(f"マスター '{master_name}' が存在しません。")
-    try:
-        bigquery_client.delete_schema_definition(master_name)
-        del _schemas[master_name] # メモリキャッシュから削除
-        print(f"マスター '{master_name}' を削除し、BigQueryからも削除しました。")
-    except Exception as e:
-        print(f"マスター '{master_name}' の削除中にエラー: {e}")
-        raise
+def add_master(master_name: str, columns: List[Dict], bq_client=None):
+    """新しいマスターとそのスキーマを登録する
+
+    bq_client を省略した場合は共有のBigQueryクライアントを使用する。
+    複数のマスターを続けて登録する場合は同じクライアントを渡すことで接続を使い回せる。
+    """
+    global _schemas
+    ensure_initialized()
+    with _lock:
+        if master_name in _schemas:
+            raise ValueError(f"マスター '{master_name}' は既に存在します。")
+        # TODO: スキーマのバリデーション (カラム名、型、セキュリティレベルなど)
+        new_schema = {"columns": columns}
+        try:
+            bigquery_client.save_schema_definition(master_name, new_schema, client=bq_client)
+            _schemas = {**_schemas, master_name: new_schema} # メモリキャッシュも更新
+            _load_schema_definitions.clear() # ディスクキャッシュも破棄
+            logger.info(f"新規マスター '{master_name}' を登録し、BigQueryに保存しました。")
+        except Exception as e:
+            logger.error(f"マスター '{master_name}' の登録・保存中にエラー: {e}")
+            raise # エラーを呼び出し元に伝える
+
+def update_schema(master_name: str, columns: List[Dict], bq_client=None):
+    """既存マスターのスキーマを更新する (bq_client を省略した場合は共有のクライアントを使用する)"""
+    global _schemas
+    ensure_initialized()
+    with _lock:
+        if master_name not in _schemas:
+            raise ValueError(f"マスター '{master_name}' が存在しません。")
+        # TODO: スキーマのバリデーション
+        updated_schema = {"columns": columns}
+        try:
+            bigquery_client.save_schema_definition(master_name, updated_schema, client=bq_client)
+            _schemas = {**_schemas, master_name: updated_schema} # メモリキャッシュも更新
+            _load_schema_definitions.clear() # ディスクキャッシュも破棄
+            logger.info(f"マスター '{master_name}' のスキーマを更新し、BigQueryに保存しました。")
+        except Exception as e:
+            logger.error(f"マスター '{master_name}' のスキーマ更新・保存中にエラー: {e}")
+            raise
 
-# --- 初期化処理 ---
-# _initialize_schemas() はモジュール読み込み時に実行される 
+def delete_master(master_name: str, bq_client=None):
+    """マスター定義を削除する (bq_client を省略した場合は共有のクライアントを使用する)"""
+    global _schemas
+    ensure_initialized()
+    with _lock:
+        if master_name not in _schemas:
+            raise ValueError(f"マスター '{master_name}' が存在しません。")
+        try:
+            bigquery_client.delete_schema_definition(master_name, client=bq_client)
+            # メモリキャッシュから削除
+            _schemas = {name: schema for name, schema in _schemas.items() if name != master_name}
+            _load_schema_definitions.clear() # ディスクキャッシュも破棄
+            logger.info(f"マスター '{master_name}' を削除し、BigQueryからも削除しました。")
+        except Exception as e:
+            logger.error(f"マスター '{master_name}' の削除中にエラー: {e}")
+            raise